@@ -1,20 +1,31 @@
 #!/usr/bin/env python3
 
 import http.server
-import socketserver
+import gzip
 import json
+import mmap
 import os
+import queue
+import re
+import signal
 import uuid
-from datetime import datetime, timezone
-try:
-    from urllib.parse import parse_qs, urlparse
-except ImportError:
-    from urlparse import parse_qs, urlparse
 from http import HTTPStatus
 from dotenv import load_dotenv
 import logging
 import sys
+import threading
+import time
 import traceback
+from collections import OrderedDict
+from contextlib import contextmanager
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import unquote
+
+# fcntl is POSIX only; without it the server always runs as one process
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 # Load environment variables from .env file
 load_dotenv()
@@ -30,36 +41,402 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Import our custom modules
-from database import DatabaseManager
+from database import DatabaseManager, MessageWriter
 from git_handler import GitHandler
+from json_utils import dumps as json_dumps, loads as json_loads
 
 # Constants
 HOST = "localhost"
 PORT = 8000
-STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static")
-TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATIC_DIR = os.path.join(ROOT_DIR, "static")
+TEMPLATE_DIR = os.path.join(ROOT_DIR, "templates")
+# Holds the PID of the running server; read by the CLI instead of scanning processes
+PID_FILE = os.path.join(ROOT_DIR, ".simplechat.pid")
+# GET paths that map straight to a file: path -> (absolute file path, content type)
+FILE_ROUTES = {
+    '/': (os.path.join(TEMPLATE_DIR, "index.html"), "text/html"),
+}
+STATIC_PREFIX = '/static/'
+# Resolved static directory; requested files must resolve to somewhere below it
+STATIC_ROOT = os.path.realpath(STATIC_DIR) + os.sep
+# Content types for static files by extension, without the dot
+CONTENT_TYPES = {
+    'js': 'application/javascript',
+    'css': 'text/css',
+}
+KEEP_ALIVE_TIMEOUT = 30  # Seconds an idle keep-alive connection stays open
+LISTEN_BACKLOG = 128  # Connections the kernel queues before refusing new ones
+MAX_CONNECTIONS = 256  # Connections served at once, one thread each
+WRITE_BUFFER_SIZE = 16 * 1024  # Response bytes gathered before a send() on each connection
+SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', 1))  # Server processes sharing the listening socket
+BULK_FLUSH_MS = int(os.environ.get('BULK_FLUSH_MS', 100))  # How long to gather messages per Git commit
+BULK_MAX = int(os.environ.get('BULK_MAX', 50))  # Maximum messages per Git commit
+MESSAGE_CACHE_SIZE = 32  # Number of serialized GET /messages pages to keep
+FILE_CACHE_CHECK_INTERVAL = 2.0  # Seconds between mtime checks of cached files
+FILE_CACHE_MAX_SIZE = 256 * 1024  # Larger files are streamed with sendfile instead
+FILE_CACHE_MAX_ENTRIES = 64  # Files kept in memory at once
+FILE_CACHE_MAX_BYTES = 8 * 1024 * 1024  # Total size of files kept in memory
+# Cached files of these types are also kept gzip-compressed for clients that accept it
+COMPRESSIBLE_EXTENSIONS = ('.html', '.js', '.css', '.svg', '.json', '.txt')
+MMAP_MAX_SIZE = 16 * 1024 * 1024  # Largest file sent from an mmap where sendfile is unavailable
 
-class ChatRequestHandler(http.server.SimpleHTTPRequestHandler):
-    """Custom request handler for the chat application"""
-    
-    def __init__(self, *args, **kwargs):
+# Fixed parts of the POST /messages success response; the id and timestamp go in between
+POST_SUCCESS_PREFIX = b'{"status":"success","message":"Message saved","id":'
+POST_SUCCESS_SUFFIX = b',"git_commit_hash":null}'
+MAX_BODY_SIZE = 1024 * 1024  # Largest POST body accepted; bigger ones get 413
+MAX_MESSAGES_LIMIT = 1000  # Most messages one GET /messages returns; larger limits are clamped
+MAX_MESSAGES_OFFSET = 2 ** 63 - 1  # Largest offset SQLite can bind; larger ones get 400
+# Per-thread request body buffer sizes
+BODY_BUFFER_MIN_SIZE = 4096
+BODY_BUFFER_MAX_SIZE = 64 * 1024
+# Sent to connections turned away because MAX_CONNECTIONS are already being served
+SERVER_BUSY_RESPONSE = (
+    b'HTTP/1.1 503 Service Unavailable\r\n'
+    b'Content-Length: 0\r\n'
+    b'Connection: close\r\n\r\n'
+)
+# Request body shape sent by the chat UI, which do_POST handles without a JSON parser
+CONTENT_BODY_PREFIX = b'{"content":"'
+NEEDS_JSON_PARSE = re.compile(rb'["\\\x00-\x1f]')
+
+# Served files are immutable while the server runs, so keep their bytes in memory
+# Maps absolute path -> (content, content length, mtime, last checked, ETag, Last-Modified,
+#                        gzip-compressed content or None)
+# Least recently used first; bounded by FILE_CACHE_MAX_ENTRIES and FILE_CACHE_MAX_BYTES
+_FILE_CACHE = OrderedDict()
+_FILE_CACHE_LOCK = threading.Lock()
+_file_cache_bytes = 0
+
+def file_validators(stat):
+    """
+    Build the cache validators sent with a served file
+    :param stat: os.stat_result of the file
+    :return: Tuple of (ETag, Last-Modified) header values
+    """
+    etag = '"%x-%x"' % (int(stat.st_mtime), stat.st_size)
+    return etag, formatdate(stat.st_mtime, usegmt=True)
+
+def gzip_variant(file_path, content):
+    """
+    Compress a text file once so it can be served with Content-Encoding: gzip
+    :param file_path: Path to the file, used to decide whether it is worth compressing
+    :param content: File content
+    :return: Compressed content, or None if the file type or result does not benefit
+    """
+    if not file_path.endswith(COMPRESSIBLE_EXTENSIONS):
+        return None
+    compressed = gzip.compress(content, compresslevel=6, mtime=0)
+    return compressed if len(compressed) < len(content) else None
+
+def accepts_gzip(accept_encoding):
+    """
+    Check whether an Accept-Encoding header allows a gzip-encoded response
+    gzip (or its alias x-gzip, or else *) must be listed with a q-value
+    above 0; "gzip;q=0" refuses it explicitly.
+    :param accept_encoding: Accept-Encoding header value, or None
+    :return: True if gzip is acceptable
+    """
+    if not accept_encoding:
+        return False
+    qvalues = {}
+    for item in accept_encoding.split(','):
+        coding, *params = item.split(';')
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues[coding.strip().lower()] = q
+    for coding in ('gzip', 'x-gzip', '*'):
+        if coding in qvalues:
+            return qvalues[coding] > 0
+    return False
+
+def _cache_entry_size(entry):
+    """Bytes held in memory by a file cache entry"""
+    return len(entry[0]) + (len(entry[6]) if entry[6] is not None else 0)
+
+def read_cached_file(file_path):
+    """
+    Read a file through the in-memory file cache
+    Cached entries are checked against the file's mtime at most once every
+    FILE_CACHE_CHECK_INTERVAL seconds, so edits are still picked up.
+    :param file_path: Absolute path to the file
+    :return: Tuple of (content bytes, content length string, ETag, Last-Modified,
+             gzip-compressed content or None), or None if the file is larger
+             than FILE_CACHE_MAX_SIZE
+    """
+    global _file_cache_bytes
+    now = time.monotonic()
+    with _FILE_CACHE_LOCK:
+        entry = _FILE_CACHE.get(file_path)
+        if entry:
+            _FILE_CACHE.move_to_end(file_path)
+    if entry and now - entry[3] < FILE_CACHE_CHECK_INTERVAL:
+        return entry[0], entry[1], entry[4], entry[5], entry[6]
+
+    stat = os.stat(file_path)
+    if stat.st_size > FILE_CACHE_MAX_SIZE:
+        with _FILE_CACHE_LOCK:
+            old_entry = _FILE_CACHE.pop(file_path, None)
+            if old_entry:
+                _file_cache_bytes -= _cache_entry_size(old_entry)
+        return None
+
+    mtime = stat.st_mtime
+    if entry and entry[2] == mtime:
+        content, content_length, etag, last_modified, gzipped = (
+            entry[0], entry[1], entry[4], entry[5], entry[6])
+    else:
+        with open(file_path, 'rb') as f:
+            content = f.read()
+        content_length = str(len(content))
+        etag, last_modified = file_validators(stat)
+        gzipped = gzip_variant(file_path, content)
+
+    with _FILE_CACHE_LOCK:
+        old_entry = _FILE_CACHE.pop(file_path, None)
+        if old_entry:
+            _file_cache_bytes -= _cache_entry_size(old_entry)
+        new_entry = (content, content_length, mtime, now, etag, last_modified, gzipped)
+        _FILE_CACHE[file_path] = new_entry
+        _file_cache_bytes += _cache_entry_size(new_entry)
+        while (len(_FILE_CACHE) > FILE_CACHE_MAX_ENTRIES
+               or _file_cache_bytes > FILE_CACHE_MAX_BYTES):
+            _, evicted = _FILE_CACHE.popitem(last=False)
+            _file_cache_bytes -= _cache_entry_size(evicted)
+    return content, content_length, etag, last_modified, gzipped
+
+_body_buffers = threading.local()
+
+def read_body(rfile, content_length):
+    """
+    Read a request body into a buffer reused by the calling thread
+    The returned view is only valid until the same thread reads the next
+    body, so it must be fully consumed before then. Bodies larger than
+    BODY_BUFFER_MAX_SIZE get a buffer of their own that is not kept.
+    :param rfile: Stream to read from
+    :param content_length: Number of bytes to read
+    :return: memoryview of the bytes actually read
+    """
+    buf = getattr(_body_buffers, 'buf', None)
+    if buf is None or len(buf) < content_length:
+        buf = bytearray(max(content_length, BODY_BUFFER_MIN_SIZE))
+        if content_length <= BODY_BUFFER_MAX_SIZE:
+            _body_buffers.buf = buf
+    view = memoryview(buf)[:content_length]
+    bytes_read = rfile.readinto(view)
+    return view[:bytes_read]
+
+def fast_extract_content(body):
+    """
+    Get the message content from a {"content":"..."} body without a JSON parser
+    This is the exact body the chat UI sends. Anything else, including
+    content with escape sequences, returns None so the caller falls back to
+    a full parse.
+    :param body: Raw request body (bytes or memoryview)
+    :return: Message content, or None if the body needs a full JSON parse
+    """
+    prefix_length = len(CONTENT_BODY_PREFIX)
+    if (len(body) < prefix_length + 2 or body[:prefix_length] != CONTENT_BODY_PREFIX
+            or body[-2:] != b'"}'):
+        return None
+    content = body[prefix_length:-2]
+    # Quotes, backslashes and control characters all need real JSON parsing
+    if NEEDS_JSON_PARSE.search(content):
+        return None
+    try:
+        return str(content, 'utf-8')
+    except UnicodeDecodeError:
+        return None
+
+# (second, formatted prefix) for the most recent utc_timestamp() call
+_timestamp_prefix = (None, '')
+
+def utc_timestamp():
+    """
+    Get the current UTC time in the format datetime.isoformat() produces
+    The date and time part only changes once a second, so it is formatted
+    once and reused; only the microseconds are added per call.
+    :return: Timestamp such as 2024-01-01T12:00:00.123456+00:00
+    """
+    global _timestamp_prefix
+    seconds, micros = divmod(time.time_ns() // 1000, 1000000)
+    cached_seconds, prefix = _timestamp_prefix
+    if cached_seconds != seconds:
+        prefix = time.strftime('%Y-%m-%dT%H:%M:%S.', time.gmtime(seconds))
+        _timestamp_prefix = (seconds, prefix)
+    return '%s%06d+00:00' % (prefix, micros)
+
+def parse_messages_query(query_string):
+    """
+    Parse the limit, offset, before and before_id parameters of a GET /messages query string
+    limit and offset are small integers, so a single scan is enough; parse_qs
+    would build dicts and lists and percent-decode every parameter on each poll.
+    :param query_string: Query string without the leading '?'
+    :return: Tuple of (limit, offset, before, before_id), before and before_id
+        being None if not given; limit is at most MAX_MESSAGES_LIMIT
+    :raises ValueError: If limit or offset is not a non-negative integer, or offset is too large
+    """
+    limit = offset = before = before_id = None
+    for part in query_string.split('&'):
+        key, _, value = part.partition('=')
+        if not value:
+            continue
+        if key == 'limit' and limit is None:
+            if not (value.isascii() and value.isdigit()):
+                raise ValueError("Invalid limit parameter")
+            limit = min(int(value), MAX_MESSAGES_LIMIT)
+        elif key == 'offset' and offset is None:
+            if not (value.isascii() and value.isdigit()):
+                raise ValueError("Invalid offset parameter")
+            offset = int(value)
+            if offset > MAX_MESSAGES_OFFSET:
+                raise ValueError("Invalid offset parameter")
+        elif key == 'before' and before is None:
+            # A message timestamp; only this value can need percent-decoding
+            before = unquote(value)
+        elif key == 'before_id' and before_id is None:
+            # Message ids are hex, but percent-decode like before in case
+            before_id = unquote(value)
+    return (100 if limit is None else limit), (0 if offset is None else offset), before, before_id
+
+# Serialized GET /messages bodies keyed by (limit, offset, before, before_id), least recently used first.
+# Every write bumps the version and clears the cache. Turned off when several
+# server processes run, since a write in one would not clear the others.
+_message_cache = OrderedDict()
+_message_cache_lock = threading.Lock()
+_message_cache_version = 0
+_message_cache_enabled = True
+
+def invalidate_message_cache():
+    """Drop cached GET /messages responses after the messages table changes"""
+    global _message_cache_version
+    with _message_cache_lock:
+        _message_cache_version += 1
+        _message_cache.clear()
+
+def build_messages_response(db_manager, limit, offset, before=None, before_id=None):
+    """
+    Query the database and build a GET /messages response body
+    :param db_manager: DatabaseManager to query
+    :param limit: Maximum number of messages to return
+    :param offset: Offset for pagination
+    :param before: Only return messages older than this timestamp
+    :param before_id: Id of the message at before, to resume among messages sharing its timestamp
+    :return: JSON response body as bytes
+    """
+    return b''.join((
+        b'{"messages":[',
+        b','.join(db_manager.get_messages_json(
+            limit=limit, offset=offset, before=before, before_id=before_id
+        )),
+        b']}'
+    ))
+
+def get_messages_response(db_manager, limit, offset, before=None, before_id=None):
+    """
+    Get the serialized GET /messages response body, from the cache if possible
+    :param db_manager: DatabaseManager to query on a cache miss
+    :param limit: Maximum number of messages to return
+    :param offset: Offset for pagination
+    :param before: Only return messages older than this timestamp
+    :param before_id: Id of the message at before, to resume among messages sharing its timestamp
+    :return: JSON response body as bytes
+    """
+    if not _message_cache_enabled:
+        return build_messages_response(db_manager, limit, offset, before, before_id)
+
+    key = (limit, offset, before, before_id)
+    with _message_cache_lock:
+        body = _message_cache.get(key)
+        if body is not None:
+            _message_cache.move_to_end(key)
+            return body
+        version = _message_cache_version
+
+    body = build_messages_response(db_manager, limit, offset, before, before_id)
+
+    # Only cache the result if no write happened while we were querying
+    with _message_cache_lock:
+        if version == _message_cache_version:
+            _message_cache[key] = body
+            if len(_message_cache) > MESSAGE_CACHE_SIZE:
+                _message_cache.popitem(last=False)
+    return body
+
+# Messages waiting to be committed to Git, as (content, message_id) tuples
+_git_queue = queue.Queue()
+# Lock file serializing Git work when several server processes share the repository
+_git_lock_path = None
+
+@contextmanager
+def git_process_lock():
+    """Hold the cross-process Git lock, if more than one server process is running"""
+    if _git_lock_path is None:
+        yield
+        return
+    with open(_git_lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
         try:
-            # Initialize database manager first
-            self.db_manager = DatabaseManager()
-            
-            # Initialize git handler
-            github_token = os.environ.get('GITHUB_TOKEN')
-            if github_token:
-                self.git_handler = GitHandler(github_token)
-            else:
-                self.git_handler = None
-                logger.warning("GITHUB_TOKEN not set. Git functionality will be disabled.")
-            
-            # Initialize parent class last
-            super().__init__(*args, **kwargs)
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def git_worker(git_handler, db_manager):
+    """
+    Commit queued messages to Git in the background
+    Waits for a message, then keeps collecting for up to BULK_FLUSH_MS (and at
+    most BULK_MAX messages) so the whole batch shares one commit and push.
+    :param git_handler: GitHandler used to commit and push
+    :param db_manager: DatabaseManager to record commit hashes in
+    """
+    while True:
+        batch = [_git_queue.get()]
+        deadline = time.monotonic() + BULK_FLUSH_MS / 1000
+        while len(batch) < BULK_MAX:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_git_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        try:
+            with git_process_lock():
+                commit_hash = git_handler.store_messages_batch(batch)
+            db_manager.update_git_commit_hashes(
+                [(message_id, commit_hash) for _, message_id in batch]
+            )
+            invalidate_message_cache()
         except Exception as e:
-            logger.error(f"Failed to initialize ChatRequestHandler: {str(e)}")
-            raise
+            logger.error(f"Failed to store {len(batch)} message(s) in Git: {str(e)}")
+        finally:
+            for _ in batch:
+                _git_queue.task_done()
+
+class ChatRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Custom request handler for the chat application"""
+
+    # Keep connections open between requests; every response sets Content-Length
+    protocol_version = "HTTP/1.1"
+    # Set TCP_NODELAY so small responses are not held back by Nagle's algorithm
+    disable_nagle_algorithm = True
+    # Close idle keep-alive connections instead of holding their thread forever
+    timeout = KEEP_ALIVE_TIMEOUT
+    # Buffer writes so headers and a small body leave in one send(); the
+    # buffer is flushed after every request
+    wbufsize = WRITE_BUFFER_SIZE
+
+    # Shared by every request; created once by run_server
+    db_manager = None
+    message_writer = None
+    git_handler = None
 
     def log_request(self, code='-', size='-'):
         """Override to provide more detailed request logging"""
@@ -67,59 +444,53 @@ class ChatRequestHandler(http.server.SimpleHTTPRequestHandler):
 
     def handle_error(self, e):
         """Handle errors and return appropriate HTTP response"""
+        if isinstance(e, ConnectionError):
+            # The client went away, possibly mid-response; writing an error
+            # response would only fail again or garble a kept-alive connection
+            logger.debug(f"Client disconnected: {str(e)}")
+            self.close_connection = True
+            return
         error_msg = str(e)
         logger.error(f"Error processing request: {error_msg}")
         logger.debug(traceback.format_exc())
         
+        body = b'{"error":' + json_dumps(error_msg) + b'}'
         self.send_response(HTTPStatus.INTERNAL_SERVER_ERROR)
         self.send_header('Content-Type', 'application/json')
-        self.end_headers()
-        self.wfile.write(json.dumps({
-            "error": error_msg
-        }).encode())
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers_with_body(body)
 
     def do_GET(self):
         """Handle GET requests"""
         try:
-            if self.path == '/':
-                self.serve_file("templates/index.html", "text/html")
-            elif self.path == '/messages':
+            # Split off the query string without a full urlparse
+            path, _, query_string = self.path.partition('?')
+            route = FILE_ROUTES.get(path)
+            if route:
+                self.serve_file(*route)
+            elif path == '/messages':
                 try:
-                    # Parse query parameters
-                    query = parse_qs(urlparse(self.path).query)
-                    
-                    # Get and validate limit parameter
+                    # Parse and validate query parameters
                     try:
-                        limit = int(query.get('limit', [100])[0])
-                        if limit < 0:
-                            raise ValueError("Limit must be non-negative")
-                    except ValueError:
-                        self.send_error(HTTPStatus.BAD_REQUEST, "Invalid limit parameter")
-                        return
-                    
-                    # Get and validate offset parameter
-                    try:
-                        offset = int(query.get('offset', [0])[0])
-                        if offset < 0:
-                            raise ValueError("Offset must be non-negative")
-                    except ValueError:
-                        self.send_error(HTTPStatus.BAD_REQUEST, "Invalid offset parameter")
+                        limit, offset, before, before_id = parse_messages_query(query_string)
+                    except ValueError as e:
+                        self.send_error(HTTPStatus.BAD_REQUEST, str(e))
                         return
                     
                     # Get messages with pagination
-                    messages = self.db_manager.get_messages(limit=limit, offset=offset)
-                    self.send_json_response({"messages": messages})
+                    body = get_messages_response(self.db_manager, limit, offset, before, before_id)
+                    self.send_json_body(body)
                 except Exception as e:
                     self.handle_error(e)
-            elif self.path.startswith('/static/'):
+            elif path.startswith(STATIC_PREFIX):
                 # Serve static files
-                file_path = self.path[1:]  # Remove leading slash
-                if file_path.endswith('.js'):
-                    content_type = 'application/javascript'
-                elif file_path.endswith('.css'):
-                    content_type = 'text/css'
-                else:
-                    content_type = 'text/plain'
+                relative_path = path[len(STATIC_PREFIX):]
+                file_path = os.path.realpath(os.path.join(STATIC_DIR, relative_path))
+                if not file_path.startswith(STATIC_ROOT):
+                    # ../ or a symlink pointing outside the static directory
+                    self.send_error(HTTPStatus.FORBIDDEN, "Forbidden")
+                    return
+                content_type = CONTENT_TYPES.get(relative_path.rpartition('.')[2], 'text/plain')
                 self.serve_file(file_path, content_type)
             else:
                 self.send_error(HTTPStatus.NOT_FOUND, "Path not found")
@@ -133,50 +504,50 @@ class ChatRequestHandler(http.server.SimpleHTTPRequestHandler):
                 try:
                     # Get the length of the request body
                     content_length = int(self.headers.get('Content-Length', 0))
-                    # Read the request body
-                    post_data = self.rfile.read(content_length)
-                    
-                    # Parse the JSON data
-                    message_data = json.loads(post_data.decode('utf-8'))
+                    if content_length < 0:
+                        raise ValueError("Invalid Content-Length")
+                    if content_length > MAX_BODY_SIZE:
+                        # send_error closes the connection, so the unread body is discarded
+                        self.send_error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Message too large")
+                        return
+                    # Read the request body into this thread's reusable buffer
+                    post_data = read_body(self.rfile, content_length)
                     
-                    # Validate message content
-                    if 'content' not in message_data:
-                        raise ValueError("Message content is required")
+                    # Parse the JSON data, skipping the parser for the usual body shape
+                    content = fast_extract_content(post_data)
+                    if content is None:
+                        message_data = json_loads(post_data)
+                        
+                        # Validate message content
+                        if 'content' not in message_data:
+                            raise ValueError("Message content is required")
+                        content = message_data['content']
                     
                     # Generate message ID and timestamp
-                    message_id = str(uuid.uuid4())
-                    timestamp = datetime.now(timezone.utc).isoformat()
+                    message_id = uuid.uuid4().hex
+                    timestamp = utc_timestamp()
                     
-                    # Save to database
-                    self.db_manager.add_message(
-                        message_data['content'],
+                    # Save to database (batched with concurrent requests)
+                    self.message_writer.add_message(
+                        content,
                         timestamp,
                         message_id
                     )
+                    invalidate_message_cache()
                     
-                    # Save to Git if enabled
-                    git_commit_hash = None
+                    # Queue for Git if enabled; the commit hash is filled in
+                    # by the background worker once the batch is pushed
                     if self.git_handler:
-                        try:
-                            git_commit_hash = self.git_handler.store_message(
-                                message_data['content'],
-                                message_id
-                            )
-                            # Update git commit hash in database
-                            self.db_manager.update_git_commit_hash(message_id, git_commit_hash)
-                        except Exception as e:
-                            logger.error(f"Failed to store message in Git: {str(e)}")
+                        _git_queue.put((content, message_id))
                     
-                    # Prepare response
-                    response_data = {
-                        "status": "success",
-                        "message": "Message saved",
-                        "id": message_id,
-                        "timestamp": timestamp,
-                        "git_commit_hash": git_commit_hash
-                    }
-                    
-                    self.send_json_response(response_data)
+                    # Build the response from its fixed parts
+                    self.send_json_body(b''.join((
+                        POST_SUCCESS_PREFIX,
+                        json_dumps(message_id),
+                        b',"timestamp":',
+                        json_dumps(timestamp),
+                        POST_SUCCESS_SUFFIX
+                    )))
                     
                 except json.JSONDecodeError:
                     self.send_error(HTTPStatus.BAD_REQUEST, "Invalid JSON payload")
@@ -190,38 +561,278 @@ class ChatRequestHandler(http.server.SimpleHTTPRequestHandler):
             self.handle_error(e)
 
     def serve_file(self, file_path, content_type):
-        """Helper method to send a file"""
+        """
+        Helper method to send a file
+        :param file_path: Absolute path to the file
+        :param content_type: Content-Type header value
+        """
         try:
-            file_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), file_path)
-            with open(file_path, 'rb') as f:
-                content = f.read()
+            cached = read_cached_file(file_path)
+            if cached is None:
+                self.send_large_file(file_path, content_type)
+                return
+            content, content_length, etag, last_modified, gzipped = cached
+            use_gzip = gzipped is not None and accepts_gzip(self.headers.get('Accept-Encoding'))
+            if use_gzip:
+                # Each encoding is a different representation, so it needs its own ETag
+                content, content_length, etag = gzipped, str(len(gzipped)), etag[:-1] + '-gzip"'
+            if self.is_not_modified(etag, last_modified):
+                self.send_not_modified(etag, last_modified, vary_encoding=gzipped is not None)
+                return
             self.send_response(HTTPStatus.OK)
             self.send_header('Content-Type', content_type)
-            self.send_header('Content-Length', str(len(content)))
-            self.end_headers()
-            self.wfile.write(content)
+            self.send_header('Content-Length', content_length)
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+            if gzipped is not None:
+                self.send_header('Vary', 'Accept-Encoding')
+            if use_gzip:
+                self.send_header('Content-Encoding', 'gzip')
+            self.end_headers_with_body(content)
         except FileNotFoundError:
             self.send_error(HTTPStatus.NOT_FOUND, "File not found")
 
+    def send_large_file(self, file_path, content_type):
+        """
+        Stream a file with sendfile(2) so its bytes never pass through Python
+        socket.sendfile falls back to plain send() where sendfile is unavailable.
+        """
+        with open(file_path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            size = stat.st_size
+            etag, last_modified = file_validators(stat)
+            if self.is_not_modified(etag, last_modified):
+                self.send_not_modified(etag, last_modified)
+                return
+            self.send_response(HTTPStatus.OK)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(size))
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+            self.end_headers()
+            self.wfile.flush()
+            # Never send more than Content-Length promised, even if the file
+            # grows meanwhile; extra bytes would corrupt a keep-alive connection
+            if hasattr(os, 'sendfile') or not 0 < size <= MMAP_MAX_SIZE:
+                self.connection.sendfile(f, 0, size)
+            else:
+                # No sendfile(2) here, so socket.sendfile would copy the file
+                # through a read buffer; send straight from the mapped pages instead
+                with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mapped:
+                    self.connection.sendall(mapped)
+
+    def is_not_modified(self, etag, last_modified):
+        """
+        Check the request's conditional headers against a file's validators
+        :param etag: Current ETag of the file
+        :param last_modified: Current Last-Modified value of the file
+        :return: True if the client's cached copy is still current
+        """
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            # If-None-Match takes precedence over If-Modified-Since
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or etag in tags or 'W/' + etag in tags
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since is None:
+            return False
+        if if_modified_since == last_modified:
+            return True
+        try:
+            return parsedate_to_datetime(if_modified_since) >= parsedate_to_datetime(last_modified)
+        except (TypeError, ValueError):
+            return False
+
+    def send_not_modified(self, etag, last_modified, vary_encoding=False):
+        """
+        Send a bodiless 304 response for a file the client already has
+        :param vary_encoding: Whether the file has a gzip variant; caches that
+                              revalidate must still keep the two apart
+        """
+        self.send_response(HTTPStatus.NOT_MODIFIED)
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', last_modified)
+        if vary_encoding:
+            self.send_header('Vary', 'Accept-Encoding')
+        self.end_headers()
+
+    def end_headers_with_body(self, body):
+        """
+        Finish the headers and send them together with the response body
+        Bodies that fit in the write buffer leave in the same send() as the
+        headers anyway. Larger ones would make the buffer flush the headers
+        on their own first, so headers and body go out in one sendmsg()
+        gather write instead, without concatenating them.
+        :param body: Response body bytes
+        """
+        if (len(body) <= WRITE_BUFFER_SIZE or not hasattr(self, '_headers_buffer')
+                or not hasattr(self.connection, 'sendmsg')):
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self._headers_buffer.append(b"\r\n")
+        buffers = [memoryview(b"".join(self._headers_buffer)), memoryview(body)]
+        self._headers_buffer = []
+        self.wfile.flush()
+        while buffers:
+            sent = self.connection.sendmsg(buffers)
+            while buffers and sent >= len(buffers[0]):
+                sent -= len(buffers[0])
+                buffers.pop(0)
+            if sent:
+                buffers[0] = buffers[0][sent:]
+
     def send_json_response(self, data):
         """Helper method to send JSON responses"""
-        response = json.dumps(data).encode('utf-8')
+        self.send_json_body(json_dumps(data))
+
+    def send_json_body(self, response):
+        """Helper method to send an already serialized JSON response"""
         self.send_response(HTTPStatus.OK)
         self.send_header("Content-Type", "application/json")
         self.send_header("Content-Length", len(response))
-        self.end_headers()
-        self.wfile.write(response)
+        self.end_headers_with_body(response)
+
+class ChatServer(http.server.ThreadingHTTPServer):
+    """
+    Threaded HTTP server with a listen backlog sized for bursts of POSTs
+    At most MAX_CONNECTIONS connections get a thread; any more are answered
+    with 503 straight away instead of piling up threads.
+    """
+    allow_reuse_address = True
+    request_queue_size = LISTEN_BACKLOG
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._connection_slots = threading.BoundedSemaphore(MAX_CONNECTIONS)
+
+    def process_request(self, request, client_address):
+        """Start a thread for the connection if a slot is free, otherwise reject it"""
+        if not self._connection_slots.acquire(blocking=False):
+            try:
+                request.sendall(SERVER_BUSY_RESPONSE)
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self._connection_slots.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        """Serve the connection, then free its slot"""
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._connection_slots.release()
+
+def start_handler_services(shared_git_repo=False):
+    """
+    Create the database manager, message writer and Git worker for this process
+    Must run after forking, since the background threads do not survive fork.
+    :param shared_git_repo: Whether other server processes use the same Git repository
+    """
+    global _git_lock_path
+    # Create the database manager and git handler once for all requests
+    db_manager = DatabaseManager()
+    ChatRequestHandler.db_manager = db_manager
+    ChatRequestHandler.message_writer = MessageWriter(db_manager)
+    github_token = os.environ.get('GITHUB_TOKEN')
+    if github_token:
+        git_handler = GitHandler(github_token)
+        ChatRequestHandler.git_handler = git_handler
+        if shared_git_repo:
+            _git_lock_path = os.path.join(git_handler.repo_path, '.git', 'simplechat-worker.lock')
+        threading.Thread(
+            target=git_worker,
+            args=(git_handler, db_manager),
+            daemon=True
+        ).start()
+    else:
+        logger.warning("GITHUB_TOKEN not set. Git functionality will be disabled.")
+
+def fork_workers(count):
+    """
+    Fork extra server processes that accept from the already listening socket
+    :param count: Number of processes to fork
+    :return: PIDs of the forked processes, or an empty list in a forked process
+    """
+    children = []
+    for _ in range(count):
+        pid = os.fork()
+        if pid == 0:
+            return []
+        children.append(pid)
+    return children
+
+# PIDs of forked worker processes; only filled in the parent process
+_worker_pids = []
+
+def stop_on_sigterm(signum, frame):
+    """Shut down on SIGTERM the same way as on Ctrl-C, passing it on to forked workers"""
+    for pid in _worker_pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    raise KeyboardInterrupt
+
+def remove_pid_file(pid, pid_file=PID_FILE):
+    """
+    Remove the PID file if it belongs to the given process
+    A second server that fails to bind the port must not delete the file of
+    the one already running, or the CLI loses track of it.
+    :param pid: Process ID the file must contain
+    :param pid_file: Path of the PID file
+    """
+    try:
+        with open(pid_file, 'r') as f:
+            if f.read().strip() != str(pid):
+                return
+        os.remove(pid_file)
+    except FileNotFoundError:
+        pass
 
 def run_server():
+    global _message_cache_enabled
+    workers = SERVER_WORKERS
+    if workers > 1 and (not hasattr(os, 'fork') or fcntl is None):
+        logger.warning("SERVER_WORKERS needs fork() and fcntl; running a single process.")
+        workers = 1
+
+    children = []
+    server_pid = os.getpid()
+    signal.signal(signal.SIGTERM, stop_on_sigterm)
     try:
-        with socketserver.TCPServer((HOST, PORT), ChatRequestHandler) as httpd:
-            logger.info(f"Server started at http://{HOST}:{PORT}")
+        # Serve each connection on its own thread so a slow git write or
+        # database query does not hold up other clients
+        with ChatServer((HOST, PORT), ChatRequestHandler) as httpd:
+            with open(PID_FILE, 'w') as f:
+                f.write(str(server_pid))
+            logger.info(f"Server started at http://{HOST}:{PORT} with {workers} process(es)")
+            if workers > 1:
+                _message_cache_enabled = False
+                children = fork_workers(workers - 1)
+                _worker_pids.extend(children)
+            start_handler_services(shared_git_repo=workers > 1)
             httpd.serve_forever()
     except KeyboardInterrupt:
         logger.info("Server stopped by user")
+        if _git_queue.unfinished_tasks:
+            logger.info("Waiting for queued messages to be committed to Git...")
+            _git_queue.join()
     except Exception as e:
         logger.error(f"Server failed to start: {str(e)}")
         sys.exit(1)
+    finally:
+        for pid in children:
+            os.waitpid(pid, 0)
+        # Forked workers run this too, but only the server process removes its file
+        if os.getpid() == server_pid:
+            remove_pid_file(server_pid)
 
 if __name__ == "__main__":
     run_server()
@@ -2,47 +2,103 @@
 
 import sqlite3
 import os
+import threading
+from concurrent.futures import Future
 from datetime import datetime
 from contextlib import contextmanager
 import json
 
+from json_utils import dumps as json_dumps
+
 # Database configuration
 DB_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "database")
 DB_PATH = os.path.join(DB_DIR, "chat.db")
 
+# Statements shared by the single-row and batched code paths
+INSERT_MESSAGE_SQL = 'INSERT INTO messages (content, timestamp, id, json_blob) VALUES (?, ?, ?, ?)'
+UPDATE_GIT_COMMIT_HASH_SQL = 'UPDATE messages SET git_commit_hash = ?, json_blob = ? WHERE id = ?'
+# Keys of the message dicts, in the order the queries select the columns
+MESSAGE_COLUMNS = ('id', 'content', 'timestamp', 'git_commit_hash')
+
+def message_json(message_id, content, timestamp, git_commit_hash=None):
+    """
+    Serialize a message the way it appears in GET /messages
+    :param message_id: Message ID
+    :param content: Message content
+    :param timestamp: Message timestamp (ISO format)
+    :param git_commit_hash: Git commit hash, if the message has been committed
+    :return: JSON object as bytes
+    """
+    return json_dumps({
+        'id': message_id,
+        'content': content,
+        'timestamp': timestamp,
+        'git_commit_hash': git_commit_hash
+    })
+
 class DatabaseManager:
     def __init__(self, db_path=DB_PATH):
         """Initialize database connection"""
         if db_path is None:
             db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "messages.db")
         
-        # Ensure data directory exists
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        # Ensure data directory exists; "file:" URIs (e.g. in-memory databases) have none
+        if not db_path.startswith('file:'):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
         
         self.db_path = db_path
+        # One connection for the manager's lifetime, shared between threads;
+        # sqlite3 connections are not safe for concurrent use, so every use
+        # goes through _get_connection and holds the lock
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, uri=db_path.startswith('file:'))
+        self._lock = threading.Lock()
+        # WAL (set once in _init_db) only needs an fsync at checkpoints with
+        # synchronous=NORMAL; the settings below are per connection
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA temp_store=MEMORY')
+        self._conn.execute('PRAGMA mmap_size=268435456')
+        self._conn.execute('PRAGMA cache_size=-20000')
         self._init_db()
 
     @contextmanager
     def _get_connection(self):
-        """Get a database connection with proper cleanup"""
-        conn = sqlite3.connect(self.db_path)
-        try:
-            yield conn
-        finally:
-            conn.close()
+        """Get exclusive use of the shared connection, rolling back on errors"""
+        with self._lock:
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
 
     def _init_db(self):
         """Initialize database tables if they don't exist"""
         with self._get_connection() as conn:
+            # Readers no longer block on writers; the mode is stored in the file
+            conn.execute('PRAGMA journal_mode=WAL')
             cursor = conn.cursor()
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS messages (
                     id TEXT PRIMARY KEY,
                     content TEXT NOT NULL,
                     timestamp TEXT NOT NULL,
-                    git_commit_hash TEXT DEFAULT NULL
+                    git_commit_hash TEXT DEFAULT NULL,
+                    json_blob BLOB DEFAULT NULL
                 )
             ''')
+            # Databases created before json_blob existed; their rows are
+            # serialized on read until they next change
+            columns = [row[1] for row in cursor.execute('PRAGMA table_info(messages)')]
+            if 'json_blob' not in columns:
+                cursor.execute('ALTER TABLE messages ADD COLUMN json_blob BLOB DEFAULT NULL')
+            # Serves ORDER BY timestamp, id pagination and time range counts;
+            # replaces the timestamp-only index of older databases
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_timestamp_id ON messages (timestamp, id)')
+            cursor.execute('DROP INDEX IF EXISTS idx_messages_timestamp')
             conn.commit()
 
     def add_message(self, content, timestamp, message_id):
@@ -56,37 +112,125 @@ class DatabaseManager:
         with self._get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
-                'INSERT INTO messages (id, content, timestamp) VALUES (?, ?, ?)',
-                (message_id, content, timestamp)
+                INSERT_MESSAGE_SQL,
+                (content, timestamp, message_id, message_json(message_id, content, timestamp))
             )
             conn.commit()
             return message_id
 
-    def get_messages(self, limit=100, offset=0):
+    def add_messages_bulk(self, rows):
+        """
+        Add several messages to the database in a single transaction
+        :param rows: List of (content, timestamp, message_id) tuples
+        """
+        with self._get_connection() as conn:
+            conn.executemany(
+                INSERT_MESSAGE_SQL,
+                [
+                    (content, timestamp, message_id, message_json(message_id, content, timestamp))
+                    for content, timestamp, message_id in rows
+                ]
+            )
+            conn.commit()
+
+    @staticmethod
+    def _page_query(select, limit, offset, before, before_id):
+        """
+        Add the ordering and pagination clauses to a messages query
+        Messages are ordered by timestamp and then id, so messages sharing a
+        timestamp have a fixed order that a (timestamp, id) cursor can resume in.
+        :param select: SELECT ... FROM messages statement
+        :param limit: Maximum number of messages to return
+        :param offset: Offset for pagination
+        :param before: Only return messages older than this timestamp, or None
+        :param before_id: With before, only return messages ordered after the one
+            with this timestamp and id; without it, messages sharing the
+            timestamp are skipped
+        :return: Tuple of (sql, parameters)
+        """
+        order = ' ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?'
+        if before is None:
+            return select + order, (limit, offset)
+        # Starts the index scan at the cursor instead of skipping rows to reach it
+        if before_id is None:
+            return select + ' WHERE timestamp < ?' + order, (before, limit, offset)
+        return select + ' WHERE (timestamp, id) < (?, ?)' + order, (before, before_id, limit, offset)
+
+    def get_messages(self, limit=100, offset=0, before=None, before_id=None):
         """
         Get messages from the database
+        Pass the timestamp and id of the last message of a page as before and
+        before_id to get the next page; unlike a growing offset, that costs
+        the same for every page.
         :param limit: Maximum number of messages to return
         :param offset: Offset for pagination
+        :param before: Only return messages older than this timestamp
+        :param before_id: Id of the message at before, to resume among messages sharing its timestamp
         :return: List of messages
         """
         with self._get_connection() as conn:
-            conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, content, timestamp, git_commit_hash
-                FROM messages
-                ORDER BY timestamp DESC
-                LIMIT ? OFFSET ?
-            ''', (limit, offset))
-            messages = []
-            for row in cursor.fetchall():
-                messages.append({
-                    'id': row['id'],
-                    'content': row['content'],
-                    'timestamp': row['timestamp'],
-                    'git_commit_hash': row['git_commit_hash']
-                })
-            return messages
+            cursor.execute(*self._page_query(
+                'SELECT id, content, timestamp, git_commit_hash FROM messages',
+                limit, offset, before, before_id
+            ))
+            # Plain tuples zipped with the column names; looking each column
+            # up by name in a sqlite3.Row is slower
+            return [dict(zip(MESSAGE_COLUMNS, row)) for row in cursor.fetchall()]
+
+    def get_messages_json(self, limit=100, offset=0, before=None, before_id=None):
+        """
+        Get messages from the database as serialized JSON objects
+        :param limit: Maximum number of messages to return
+        :param offset: Offset for pagination
+        :param before: Only return messages older than this timestamp
+        :param before_id: Id of the message at before, to resume among messages sharing its timestamp
+        :return: List of JSON objects as bytes, in the same order as get_messages
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(*self._page_query(
+                'SELECT json_blob, id, content, timestamp, git_commit_hash FROM messages',
+                limit, offset, before, before_id
+            ))
+            return [
+                row[0] if row[0] is not None else message_json(*row[1:])
+                for row in cursor.fetchall()
+            ]
+
+    def _serialize_git_updates(self, conn, updates):
+        """
+        Build UPDATE_GIT_COMMIT_HASH_SQL parameters, re-serializing each message
+        :param conn: Open database connection
+        :param updates: List of (message_id, commit_hash) tuples
+        :return: List of (commit_hash, json_blob, message_id) tuples
+        """
+        # Look the messages up in one query per chunk rather than one per message;
+        # chunks stay under SQLite's default limit on bound parameters
+        rows = {}
+        message_ids = [message_id for message_id, _ in updates]
+        for start in range(0, len(message_ids), 500):
+            chunk = message_ids[start:start + 500]
+            rows.update(
+                (message_id, (content, timestamp))
+                for message_id, content, timestamp in conn.execute(
+                    'SELECT id, content, timestamp FROM messages WHERE id IN ({})'.format(
+                        ','.join('?' * len(chunk))
+                    ),
+                    chunk
+                )
+            )
+
+        params = []
+        for message_id, commit_hash in updates:
+            row = rows.get(message_id)
+            if row is None:
+                continue
+            content, timestamp = row
+            params.append(
+                (commit_hash, message_json(message_id, content, timestamp, commit_hash), message_id)
+            )
+        return params
 
     def update_git_commit_hash(self, message_id, commit_hash):
         """
@@ -95,13 +239,21 @@ class DatabaseManager:
         :param commit_hash: Git commit hash
         """
         with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                'UPDATE messages SET git_commit_hash = ? WHERE id = ?',
-                (commit_hash, message_id)
+            conn.executemany(
+                UPDATE_GIT_COMMIT_HASH_SQL,
+                self._serialize_git_updates(conn, [(message_id, commit_hash)])
             )
             conn.commit()
 
+    def update_git_commit_hashes(self, updates):
+        """
+        Update the Git commit hash for several messages in a single transaction
+        :param updates: List of (message_id, commit_hash) tuples
+        """
+        with self._get_connection() as conn:
+            conn.executemany(UPDATE_GIT_COMMIT_HASH_SQL, self._serialize_git_updates(conn, updates))
+            conn.commit()
+
     def get_message_by_id(self, message_id):
         """
         Get a message by its ID
@@ -109,7 +261,6 @@ class DatabaseManager:
         :return: Message data or None if not found
         """
         with self._get_connection() as conn:
-            conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT id, content, timestamp, git_commit_hash
@@ -118,14 +269,71 @@ class DatabaseManager:
             ''', (message_id,))
             row = cursor.fetchone()
             if row:
-                return {
-                    'id': row['id'],
-                    'content': row['content'],
-                    'timestamp': row['timestamp'],
-                    'git_commit_hash': row['git_commit_hash']
-                }
+                return dict(zip(MESSAGE_COLUMNS, row))
             return None
 
+class MessageWriter:
+    """
+    Group commit for new messages
+    Messages added from concurrent requests are inserted together in one
+    transaction by a background thread, so under load many inserts share a
+    single commit. add_message still returns only once the message is stored.
+    """
+
+    def __init__(self, db_manager):
+        """
+        Start the writer thread
+        :param db_manager: DatabaseManager to write messages to
+        """
+        self.db_manager = db_manager
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add_message(self, content, timestamp, message_id):
+        """
+        Add a new message and wait until it has been committed
+        :param content: Message content
+        :param timestamp: Message timestamp (ISO format)
+        :param message_id: Message ID
+        :return: Message ID
+        """
+        future = Future()
+        with self._lock:
+            self._pending.append(((content, timestamp, message_id), future))
+            self._wakeup.set()
+        future.result()
+        return message_id
+
+    def _run(self):
+        """Write whatever has been queued since the last commit, forever"""
+        while True:
+            self._wakeup.wait()
+            with self._lock:
+                pending, self._pending = self._pending, []
+                self._wakeup.clear()
+            if not pending:
+                continue
+
+            try:
+                self.db_manager.add_messages_bulk([row for row, _ in pending])
+            except sqlite3.Error:
+                # Retry one at a time so a bad row only fails its own request
+                for row, future in pending:
+                    try:
+                        self.db_manager.add_message(*row)
+                        future.set_result(None)
+                    except Exception as e:
+                        future.set_exception(e)
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+            else:
+                for _, future in pending:
+                    future.set_result(None)
+
 def init_database():
     """Initialize the database with the schema"""
     db_manager = DatabaseManager()
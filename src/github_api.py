@@ -1,14 +1,41 @@
 #!/usr/bin/env python3
 
 import os
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from collections import OrderedDict
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional
 from datetime import datetime
 from dataclasses import dataclass
 
+from json_utils import loads as json_loads
+
+# Number of get_commits responses kept for reuse and conditional requests
+COMMITS_CACHE_SIZE = 64
+# Seconds a get_commits response is reused without asking GitHub again
+COMMITS_CACHE_TTL = 30
+# Most pages get_commit_messages fetches at the same time
+MAX_PAGE_WORKERS = 8
+# Seconds to wait for GitHub to connect or send data
+REQUEST_TIMEOUT = 10
+# Headers sent with every request; read-only since all clients share it
+BASE_HEADERS = MappingProxyType({
+    "Accept": "application/vnd.github.v3+json",
+    "User-Agent": "SimpleChat-App"
+})
+
 @dataclass
 class CommitInfo:
     """Structured representation of a Git commit"""
+    # No per-instance __dict__; pages can hold up to 100 of these each.
+    # Declared by hand since dataclass(slots=True) needs Python 3.10
+    __slots__ = ('sha', 'message', 'author_name', 'author_email', 'timestamp', 'url')
+
     sha: str
     message: str
     author_name: str
@@ -19,21 +46,37 @@ class CommitInfo:
 class GitHubAPI:
     """Class to interact with GitHub REST API"""
     
-    def __init__(self, token: Optional[str] = None):
+    def __init__(self, token: Optional[str] = None, cache_ttl: float = COMMITS_CACHE_TTL):
         """
         Initialize GitHub API client
         :param token: GitHub personal access token. If not provided, will look for GITHUB_TOKEN env var
+        :param cache_ttl: Seconds to reuse a get_commits response before asking GitHub again
         """
         self.token = token or os.environ.get('GITHUB_TOKEN')
         if not self.token:
             raise ValueError("GitHub token is required. Set GITHUB_TOKEN environment variable.")
         
         self.base_url = "https://api.github.com"
-        self.headers = {
-            "Accept": "application/vnd.github.v3+json",
-            "Authorization": f"token {self.token}",
-            "User-Agent": "SimpleChat-App"
-        }
+        self.headers = {**BASE_HEADERS, "Authorization": f"token {self.token}"}
+        # Reuses the TCP and TLS connection between requests; the pool keeps
+        # one connection per concurrent page fetch. Gateway errors from GitHub
+        # are usually transient, so those are retried with backoff
+        self._session = requests.Session()
+        self._session.mount("https://", HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=MAX_PAGE_WORKERS,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+        ))
+        # (url, params) -> (ETag or None, commits, time fetched) of earlier
+        # responses, least recently used first
+        self.cache_ttl = cache_ttl
+        self._commits_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def invalidate(self):
+        """Forget cached get_commits responses so the next calls ask GitHub"""
+        with self._cache_lock:
+            self._commits_cache.clear()
 
     def get_commits(
         self,
@@ -72,28 +115,51 @@ class GitHubAPI:
         if until:
             params["until"] = until
         
+        cache_key = (url, tuple(sorted(params.items())))
+        with self._cache_lock:
+            cached = self._commits_cache.get(cache_key)
+            if cached:
+                self._commits_cache.move_to_end(cache_key)
+        # A recent identical request is answered without a round trip
+        if cached and time.monotonic() - cached[2] < self.cache_ttl:
+            return list(cached[1])
+
+        # Otherwise ask GitHub to answer 304 Not Modified if nothing changed
+        # since then; those don't count against the rate limit
+        headers = self.headers
+        if cached and cached[0]:
+            headers = dict(self.headers, **{"If-None-Match": cached[0]})
+
         try:
             # Make API request
-            response = requests.get(url, headers=self.headers, params=params)
+            response = self._session.get(url, headers=headers, params=params, timeout=REQUEST_TIMEOUT)
+            if cached and response.status_code == 304:
+                self._cache_commits(cache_key, cached[0], cached[1])
+                return list(cached[1])
             response.raise_for_status()
             
-            # Parse response
-            commits = []
-            commit_data_list = response.json()
+            # Parse the raw bytes; response.json() decodes to str first
+            commit_data_list = json_loads(response.content)
             if not isinstance(commit_data_list, list):
                 raise ValueError("Invalid response format from GitHub API")
                 
-            for commit_data in commit_data_list:
-                commits.append(CommitInfo(
-                    sha=commit_data["sha"],
-                    message=commit_data["commit"]["message"],
-                    author_name=commit_data["commit"]["author"]["name"],
-                    author_email=commit_data["commit"]["author"]["email"],
-                    timestamp=commit_data["commit"]["author"]["date"],
-                    url=commit_data["html_url"]
-                ))
+            # Positional arguments in field order; each nested dict is looked
+            # up once per commit
+            commits = [
+                CommitInfo(
+                    commit_data["sha"],
+                    (commit := commit_data["commit"])["message"],
+                    (author := commit["author"])["name"],
+                    author["email"],
+                    author["date"],
+                    commit_data["html_url"]
+                )
+                for commit_data in commit_data_list
+            ]
+
+            self._cache_commits(cache_key, response.headers.get("ETag"), commits)
             
-            return commits
+            return list(commits)
             
         except requests.exceptions.RequestException as e:
             if hasattr(e.response, 'status_code') and e.response.status_code == 404:
@@ -103,6 +169,19 @@ class GitHubAPI:
             else:
                 raise ValueError(f"Failed to fetch commits: {str(e)}") from e
 
+    def _cache_commits(self, cache_key, etag, commits):
+        """
+        Remember a get_commits response, evicting the least recently used one if full
+        :param cache_key: (url, params) of the request
+        :param etag: ETag of the response, or None
+        :param commits: Parsed commits
+        """
+        with self._cache_lock:
+            self._commits_cache[cache_key] = (etag, commits, time.monotonic())
+            self._commits_cache.move_to_end(cache_key)
+            if len(self._commits_cache) > COMMITS_CACHE_SIZE:
+                self._commits_cache.popitem(last=False)
+
     def get_commit_messages(
         self,
         owner: str,
@@ -123,25 +202,33 @@ class GitHubAPI:
         per_page = min(max_commits, 100)
         pages = (max_commits + per_page - 1) // per_page
         
-        messages = []
-        for page in range(1, pages + 1):
-            commits = self.get_commits(
+        def fetch(page):
+            return self.get_commits(
                 owner=owner,
                 repo=repo,
                 per_page=per_page,
                 page=page,
                 **kwargs
             )
-            
-            # Add messages
-            messages.extend(commit.message for commit in commits)
-            
-            # Check if we have enough messages
-            if len(messages) >= max_commits:
-                return messages[:max_commits]
-            
-            # Check if this is the last page
-            if len(commits) < per_page:
-                break
-        
-        return messages
+
+        # The first page tells whether there are more
+        first_page = fetch(1)
+        messages = [commit.message for commit in first_page]
+        if pages == 1 or len(first_page) < per_page:
+            return messages[:max_commits]
+
+        # The rest are fetched concurrently, since each request is mostly
+        # waiting on GitHub, but a window at a time: the first short page is
+        # the end of the history, and no request starts past its window
+        window_size = MAX_PAGE_WORKERS
+        with ThreadPoolExecutor(max_workers=min(pages - 1, window_size)) as executor:
+            for start in range(2, pages + 1, window_size):
+                window = range(start, min(start + window_size, pages + 1))
+                for commits in executor.map(fetch, window):
+                    messages.extend(commit.message for commit in commits)
+
+                    # Check if this is the last page
+                    if len(commits) < per_page:
+                        return messages[:max_commits]
+
+        return messages[:max_commits]
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+
+import json
+
+# orjson is optional: it is much faster than the standard library and works
+# with bytes directly, but everything keeps working without it.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def dumps(data, indent=False):
+    """
+    Serialize data to compact UTF-8 encoded JSON
+    :param data: JSON-serializable object
+    :param indent: Pretty-print with two-space indentation instead
+    :return: JSON document as bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else None)
+    if indent:
+        return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def loads(data):
+    """
+    Parse a JSON document
+    :param data: JSON document as bytes, bytearray, memoryview or str
+    :return: Parsed object
+    :raises json.JSONDecodeError: If the document is not valid JSON
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
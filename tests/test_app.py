@@ -9,27 +9,28 @@ import os
 import sys
 import sqlite3
 import socket
+import shutil
+import tempfile
+import urllib.parse
 from datetime import datetime, timezone
 
 # Add src directory to Python path
 sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
 
-from app import ChatRequestHandler
-from database import DatabaseManager
-import socketserver
+from app import ChatRequestHandler, invalidate_message_cache, fast_extract_content, remove_pid_file
+from database import DatabaseManager, MessageWriter
+import http.server
 
-class TestServer(socketserver.TCPServer):
+class TestServer(http.server.ThreadingHTTPServer):
     allow_reuse_address = True  # This fixes the "Address already in use" error
 
 def run_test_server(handler_class, db_path):
     """Run server for testing"""
     # Create handler class with test database
     class TestHandler(handler_class):
-        def setup(self):
-            """Initialize the handler"""
-            super().setup()
-            self.db_manager = DatabaseManager(db_path)
-            self.git_handler = None  # Disable Git for tests
+        db_manager = DatabaseManager(db_path)
+        message_writer = MessageWriter(db_manager)
+        git_handler = None  # Disable Git for tests
     
     with TestServer(("localhost", 8000), TestHandler) as httpd:
         httpd.serve_forever()
@@ -38,16 +39,9 @@ class TestChatApp(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         """Set up test environment and start server"""
-        # Use test database
-        cls.test_db_path = os.path.join(
-            os.path.dirname(os.path.dirname(__file__)),
-            "data",
-            "test_messages.db"
-        )
-        
-        # Remove test database if it exists
-        if os.path.exists(cls.test_db_path):
-            os.remove(cls.test_db_path)
+        # Use an in-memory test database shared by every connection in the
+        # process; it lives as long as cls.db_manager keeps it open
+        cls.test_db_path = "file:test_messages?mode=memory&cache=shared"
         
         # Create test database
         cls.db_manager = DatabaseManager(cls.test_db_path)
@@ -60,29 +54,32 @@ class TestChatApp(unittest.TestCase):
         cls.server_thread.daemon = True
         cls.server_thread.start()
         
-        # Wait for server to start
-        time.sleep(1)
+        # Wait for server to start accepting connections
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(("localhost", 8000), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.01)
+
+        # One keep-alive connection for all tests; each test reads its responses
+        cls.conn = http.client.HTTPConnection("localhost", 8000)
 
     def setUp(self):
         """Set up test case"""
-        self.conn = http.client.HTTPConnection("localhost", 8000)
-        
         # Clear database before each test
-        with sqlite3.connect(self.test_db_path) as conn:
+        with sqlite3.connect(self.test_db_path, uri=True) as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM messages")
             conn.commit()
-
-    def tearDown(self):
-        """Clean up after test"""
-        self.conn.close()
+        invalidate_message_cache()
 
     @classmethod
     def tearDownClass(cls):
         """Clean up test environment"""
-        # Remove test database
-        if os.path.exists(cls.test_db_path):
-            os.remove(cls.test_db_path)
+        cls.conn.close()
+        cls.db_manager.close()
 
     def test_post_message(self):
         """Test posting a message"""
@@ -166,6 +163,35 @@ class TestChatApp(unittest.TestCase):
         messages = self.db_manager.get_messages()
         self.assertEqual(len(messages), 0)
 
+    def test_post_message_ui_body(self):
+        """Test posting the compact body the chat UI sends, as JSON.stringify writes it"""
+        for content in ["Hello", "Grüße, 世界 👋", 'Say "hi" \\ bye\n']:
+            body = json.dumps({"content": content}, separators=(",", ":"), ensure_ascii=False)
+            self.conn.request("POST", "/messages", body=body.encode("utf-8"),
+                              headers={"Content-Type": "application/json"})
+            response = self.conn.getresponse()
+            self.assertEqual(response.status, 200)
+            response_data = json.loads(response.read().decode())
+
+            message = self.db_manager.get_message_by_id(response_data["id"])
+            self.assertEqual(message["content"], content)
+
+    def test_post_message_too_large(self):
+        """Test that oversized bodies are rejected before being read"""
+        # Only announce the body: the server answers and closes the connection
+        # without reading it, which would break the pipe mid-send
+        self.conn.putrequest("POST", "/messages")
+        self.conn.putheader("Content-Length", str(2 * 1024 * 1024))
+        self.conn.endheaders()
+        response = self.conn.getresponse()
+        self.assertEqual(response.status, 413)
+        response.read()
+        # Reconnect on the next request
+        self.conn.close()
+
+        messages = self.db_manager.get_messages()
+        self.assertEqual(len(messages), 0)
+
     def test_get_messages(self):
         """Test getting messages after posting"""
         # Post multiple messages
@@ -252,6 +278,30 @@ class TestChatApp(unittest.TestCase):
                 messages[i + 1]["timestamp"]
             )
 
+    def test_get_messages_before(self):
+        """Test paging through messages with the before parameter"""
+        headers = {"Content-Type": "application/json"}
+        for i in range(5):
+            self.conn.request("POST", "/messages", body=json.dumps({"content": f"Test message {i}"}), headers=headers)
+            self.conn.getresponse().read()
+
+        self.conn.request("GET", "/messages?limit=3")
+        response = self.conn.getresponse()
+        first_page = json.loads(response.read().decode())["messages"]
+        self.assertEqual(len(first_page), 3)
+
+        # Timestamps contain '+' and ':', so clients percent-encode them
+        before = urllib.parse.quote(first_page[-1]["timestamp"], safe="")
+        before_id = first_page[-1]["id"]
+        self.conn.request("GET", f"/messages?limit=3&before={before}&before_id={before_id}")
+        response = self.conn.getresponse()
+        self.assertEqual(response.status, 200)
+        second_page = json.loads(response.read().decode())["messages"]
+        self.assertEqual(
+            [m["content"] for m in second_page],
+            ["Test message 1", "Test message 0"]
+        )
+
     def test_get_messages_invalid_params(self):
         """Test invalid parameters for GET /messages"""
         # Test invalid limit
@@ -278,13 +328,26 @@ class TestChatApp(unittest.TestCase):
         self.assertEqual(response.status, 400)
         response.read()  # Clear the response
 
+        # Test offset too large for SQLite
+        self.conn.request("GET", "/messages?offset=%d" % 2 ** 63)
+        response = self.conn.getresponse()
+        self.assertEqual(response.status, 400)
+        response.read()  # Clear the response
+
+        # Test limit too large for SQLite; it is clamped instead of rejected
+        self.conn.request("GET", "/messages?limit=99999999999999999999")
+        response = self.conn.getresponse()
+        self.assertEqual(response.status, 200)
+        response.read()  # Clear the response
+
     def test_get_messages_empty_db(self):
         """Test getting messages from empty database"""
         # Clear database
-        with sqlite3.connect(self.test_db_path) as conn:
+        with sqlite3.connect(self.test_db_path, uri=True) as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM messages")
             conn.commit()
+        invalidate_message_cache()
         
         # Get messages
         self.conn.request("GET", "/messages")
@@ -295,5 +358,139 @@ class TestChatApp(unittest.TestCase):
         self.assertIn("messages", response_data)
         self.assertEqual(response_data["messages"], [])
 
+    def test_index_conditional_get(self):
+        """Test that a cached copy of the index page is answered with 304"""
+        self.conn.request("GET", "/")
+        response = self.conn.getresponse()
+        self.assertEqual(response.status, 200)
+        response.read()
+        etag = response.getheader("ETag")
+        last_modified = response.getheader("Last-Modified")
+        self.assertIsNotNone(etag)
+        self.assertIsNotNone(last_modified)
+
+        self.conn.request("GET", "/", headers={"If-None-Match": etag})
+        response = self.conn.getresponse()
+        self.assertEqual(response.status, 304)
+        self.assertEqual(response.read(), b"")
+
+        self.conn.request("GET", "/", headers={"If-Modified-Since": last_modified})
+        response = self.conn.getresponse()
+        self.assertEqual(response.status, 304)
+        response.read()
+
+        self.conn.request("GET", "/", headers={"If-None-Match": '"stale"'})
+        response = self.conn.getresponse()
+        self.assertEqual(response.status, 200)
+        response.read()
+
+    def test_index_gzip_negotiation(self):
+        """Test that gzip is only sent when Accept-Encoding allows it"""
+        for accept_encoding, expect_gzip in (
+            ("gzip, deflate", True),
+            ("deflate, gzip;q=0.5", True),
+            ("*", True),
+            ("gzip;q=0", False),
+            ("gzip;q=0, *", False),
+            ("x-gzip-foo", False),
+            ("identity", False)
+        ):
+            with self.subTest(accept_encoding=accept_encoding):
+                self.conn.request("GET", "/", headers={"Accept-Encoding": accept_encoding})
+                response = self.conn.getresponse()
+                response.read()
+                self.assertEqual(response.status, 200)
+                self.assertEqual(response.getheader("Content-Encoding") == "gzip", expect_gzip)
+                self.assertEqual(response.getheader("Vary"), "Accept-Encoding")
+
+    def test_index_not_modified_varies_on_encoding(self):
+        """Test that a 304 for a file with a gzip variant carries Vary: Accept-Encoding"""
+        self.conn.request("GET", "/", headers={"Accept-Encoding": "gzip"})
+        response = self.conn.getresponse()
+        response.read()
+        etag = response.getheader("ETag")
+
+        self.conn.request("GET", "/", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+        response = self.conn.getresponse()
+        response.read()
+        self.assertEqual(response.status, 304)
+        self.assertEqual(response.getheader("Vary"), "Accept-Encoding")
+
+    def test_static_path_traversal(self):
+        """Test that static paths cannot escape the static directory"""
+        self.conn.request("GET", "/static/../templates/index.html")
+        response = self.conn.getresponse()
+        self.assertEqual(response.status, 403)
+        response.read()
+
+class TestFastExtractContent(unittest.TestCase):
+    """Tests for the parser-free path of POST /messages"""
+
+    def ui_body(self, content):
+        """The body the chat UI sends: JSON.stringify({ content }), UTF-8 encoded"""
+        return json.dumps({"content": content}, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    def test_plain_content(self):
+        """Test that the UI's body is read without a JSON parser"""
+        self.assertEqual(fast_extract_content(self.ui_body("Hello, world")), "Hello, world")
+        # The handler passes a view of its reusable buffer
+        self.assertEqual(fast_extract_content(memoryview(self.ui_body("Hello"))), "Hello")
+
+    def test_non_ascii_content(self):
+        """Test that raw UTF-8, as JSON.stringify leaves it, is decoded"""
+        content = "Grüße, 世界 👋"
+        self.assertEqual(fast_extract_content(self.ui_body(content)), content)
+
+    def test_escapes_fall_back(self):
+        """Test that escaped quotes, backslashes and control characters fall back to json.loads"""
+        for content in ['Say "hi"', "C:\\temp", "line one\nline two", "tab\there", '\\"']:
+            body = self.ui_body(content)
+            self.assertIsNone(fast_extract_content(body))
+            self.assertEqual(json.loads(body)["content"], content)
+
+    def test_malformed_utf8_falls_back(self):
+        """Test that invalid UTF-8 is left to json.loads to reject"""
+        body = b'{"content":"\xff\xfe"}'
+        self.assertIsNone(fast_extract_content(body))
+        with self.assertRaises(ValueError):
+            json.loads(body)
+
+    def test_other_shapes_fall_back(self):
+        """Test that bodies not shaped exactly like the UI's need a full parse"""
+        for body in [
+            b'{"content": "spaced"}',
+            b'{"content":"extra","x":1}',
+            b'{"content":""',
+            b'{"content":"',
+            b'',
+        ]:
+            self.assertIsNone(fast_extract_content(body))
+        self.assertEqual(fast_extract_content(b'{"content":""}'), "")
+
+class TestRemovePidFile(unittest.TestCase):
+    def setUp(self):
+        """Set up a temporary PID file path"""
+        self.pid_file = os.path.join(tempfile.mkdtemp(), "simplechat.pid")
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.pid_file))
+
+    def test_removes_own_pid_file(self):
+        """Test that the process that wrote the PID file removes it"""
+        with open(self.pid_file, 'w') as f:
+            f.write(str(os.getpid()))
+        remove_pid_file(os.getpid(), self.pid_file)
+        self.assertFalse(os.path.exists(self.pid_file))
+
+    def test_keeps_other_servers_pid_file(self):
+        """Test that a server that failed to start leaves the running server's PID file"""
+        with open(self.pid_file, 'w') as f:
+            f.write("12345")
+        remove_pid_file(os.getpid(), self.pid_file)
+        with open(self.pid_file, 'r') as f:
+            self.assertEqual(f.read(), "12345")
+
+    def test_missing_pid_file(self):
+        """Test that a missing PID file is not an error"""
+        remove_pid_file(os.getpid(), self.pid_file)
+
 if __name__ == "__main__":
     unittest.main()
@@ -4,8 +4,15 @@ import unittest
 import os
 import tempfile
 import shutil
+import sqlite3
+import sys
+import json
 from datetime import datetime, timezone
-from src.database import DatabaseManager
+
+# Add src directory to Python path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
+
+from database import DatabaseManager, MessageWriter
 
 class TestDatabaseManager(unittest.TestCase):
     def setUp(self):
@@ -16,6 +23,7 @@ class TestDatabaseManager(unittest.TestCase):
 
     def tearDown(self):
         """Clean up test environment"""
+        self.db_manager.close()
         shutil.rmtree(self.test_dir)
 
     def test_add_message(self):
@@ -63,6 +71,39 @@ class TestDatabaseManager(unittest.TestCase):
         result = self.db_manager.get_messages(limit=2, offset=5)
         self.assertEqual(len(result), 0)
 
+    def test_get_messages_before(self):
+        """Test keyset pagination with the before parameter"""
+        for i in range(5):
+            self.db_manager.add_message(f"Message {i}", f"2024-01-01T00:00:0{i}+00:00", f"test-{i}")
+
+        first_page = self.db_manager.get_messages(limit=2)
+        self.assertEqual([m['id'] for m in first_page], ["test-4", "test-3"])
+
+        second_page = self.db_manager.get_messages(limit=2, before=first_page[-1]['timestamp'])
+        self.assertEqual([m['id'] for m in second_page], ["test-2", "test-1"])
+        self.assertEqual(
+            second_page,
+            self.db_manager.get_messages(limit=2, offset=2)
+        )
+
+        json_page = self.db_manager.get_messages_json(limit=2, before=second_page[-1]['timestamp'])
+        self.assertEqual([json.loads(blob)['id'] for blob in json_page], ["test-0"])
+
+    def test_get_messages_before_same_timestamp(self):
+        """Test that a (timestamp, id) cursor resumes inside a group of equal timestamps"""
+        timestamp = "2024-01-01T00:00:00+00:00"
+        for i in range(5):
+            self.db_manager.add_message(f"Message {i}", timestamp, f"test-{i}")
+
+        seen = []
+        page = self.db_manager.get_messages(limit=2)
+        while page:
+            seen.extend(m['id'] for m in page)
+            page = self.db_manager.get_messages(
+                limit=2, before=page[-1]['timestamp'], before_id=page[-1]['id']
+            )
+        self.assertEqual(seen, ["test-4", "test-3", "test-2", "test-1", "test-0"])
+
     def test_update_git_commit_hash(self):
         """Test updating git commit hash"""
         # Add a message
@@ -79,6 +120,92 @@ class TestDatabaseManager(unittest.TestCase):
         message = self.db_manager.get_message_by_id(message_id)
         self.assertEqual(message['git_commit_hash'], commit_hash)
 
+    def test_add_messages_bulk(self):
+        """Test adding several messages in one transaction"""
+        timestamp = datetime.now(timezone.utc).isoformat()
+        rows = [(f"Message {i}", timestamp, f"test-{i}") for i in range(3)]
+
+        self.db_manager.add_messages_bulk(rows)
+
+        for content, _, message_id in rows:
+            message = self.db_manager.get_message_by_id(message_id)
+            self.assertEqual(message['content'], content)
+
+    def test_update_git_commit_hashes(self):
+        """Test updating git commit hashes for several messages"""
+        timestamp = datetime.now(timezone.utc).isoformat()
+        self.db_manager.add_message("First", timestamp, "test-1")
+        self.db_manager.add_message("Second", timestamp, "test-2")
+
+        self.db_manager.update_git_commit_hashes([("test-1", "abc123"), ("test-2", "abc123")])
+
+        self.assertEqual(self.db_manager.get_message_by_id("test-1")['git_commit_hash'], "abc123")
+        self.assertEqual(self.db_manager.get_message_by_id("test-2")['git_commit_hash'], "abc123")
+
+    def test_message_writer(self):
+        """Test that MessageWriter stores messages before returning"""
+        writer = MessageWriter(self.db_manager)
+        timestamp = datetime.now(timezone.utc).isoformat()
+
+        writer.add_message("Test message", timestamp, "test-123")
+
+        message = self.db_manager.get_message_by_id("test-123")
+        self.assertIsNotNone(message)
+        self.assertEqual(message['content'], "Test message")
+
+    def test_message_writer_duplicate_id(self):
+        """Test that a failed insert is reported to the caller"""
+        writer = MessageWriter(self.db_manager)
+        timestamp = datetime.now(timezone.utc).isoformat()
+        writer.add_message("First", timestamp, "test-123")
+
+        with self.assertRaises(sqlite3.IntegrityError):
+            writer.add_message("Second", timestamp, "test-123")
+
+    def test_failed_write_releases_lock(self):
+        """Test that a failed insert does not leave the shared connection holding a write lock"""
+        timestamp = datetime.now(timezone.utc).isoformat()
+        self.db_manager.add_message("First", timestamp, "test-123")
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.db_manager.add_message("Second", timestamp, "test-123")
+
+        # Another connection can still write
+        with sqlite3.connect(self.db_path, timeout=0) as conn:
+            conn.execute("DELETE FROM messages")
+        self.assertEqual(self.db_manager.get_messages(), [])
+
+    def test_get_messages_json(self):
+        """Test that stored JSON matches get_messages, including after a git update"""
+        self.db_manager.add_message("First", "2024-01-01T00:00:00+00:00", "msg-1")
+        self.db_manager.add_messages_bulk([("Second \"quoted\"", "2024-01-01T00:00:01+00:00", "msg-2")])
+        self.db_manager.update_git_commit_hash("msg-1", "abc123")
+
+        result = [json.loads(blob) for blob in self.db_manager.get_messages_json()]
+        self.assertEqual(result, self.db_manager.get_messages())
+        self.assertEqual(result[1]['git_commit_hash'], "abc123")
+
+    def test_get_messages_json_legacy_rows(self):
+        """Test rows without stored JSON, e.g. from an older database"""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(
+            'INSERT INTO messages (id, content, timestamp) VALUES (?, ?, ?)',
+            ("old-1", "Old message", "2024-01-01T00:00:00+00:00")
+        )
+        conn.commit()
+        conn.close()
+
+        result = [json.loads(blob) for blob in self.db_manager.get_messages_json()]
+        self.assertEqual(result, self.db_manager.get_messages())
+
+    def test_wal_journal_mode(self):
+        """Test that the database is switched to write-ahead logging"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+        finally:
+            conn.close()
+        self.assertEqual(mode, 'wal')
+
     def test_get_message_by_id_nonexistent(self):
         """Test getting a nonexistent message"""
         message = self.db_manager.get_message_by_id("nonexistent-id")
@@ -4,6 +4,10 @@ import os
 import sys
 import unittest
 import json
+import shutil
+import subprocess
+import tempfile
+from unittest.mock import patch
 from datetime import datetime, timezone
 
 # Add src directory to Python path
@@ -13,12 +17,35 @@ from git_handler import GitHandler
 class TestGitIntegration(unittest.TestCase):
     def setUp(self):
         """Set up test environment"""
-        self.github_token = os.environ.get('GITHUB_TOKEN')
-        if not self.github_token:
-            self.skipTest("GITHUB_TOKEN environment variable not set")
-        
-        # Initialize GitHandler
-        self.git_handler = GitHandler(self.github_token)
+        self.remote_dir = None
+        if os.environ.get('SIMPLECHAT_REAL_REMOTE') == '1':
+            # Push to the real GitHub repository
+            self.github_token = os.environ.get('GITHUB_TOKEN')
+            if not self.github_token:
+                self.skipTest("GITHUB_TOKEN environment variable not set")
+            self.git_handler = GitHandler(self.github_token)
+            return
+
+        # By default push to a local bare repository, which needs no network
+        test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, test_dir)
+        self.remote_dir = os.path.join(test_dir, 'remote.git')
+        work_dir = os.path.join(test_dir, 'work')
+        for command in (
+            ['git', 'init', '--bare', '-b', 'main', self.remote_dir],
+            ['git', 'init', '-b', 'main', work_dir],
+            ['git', '-C', work_dir, 'config', 'user.name', 'Test User'],
+            ['git', '-C', work_dir, 'config', 'user.email', 'test@example.com'],
+            ['git', '-C', work_dir, 'remote', 'add', 'origin', self.remote_dir],
+            ['git', '-C', work_dir, 'commit', '--allow-empty', '-m', 'Initial commit'],
+            ['git', '-C', work_dir, 'push', 'origin', 'main'],
+        ):
+            subprocess.run(command, check=True, capture_output=True)
+
+        patcher = patch.object(GitHandler, '_find_git_root', return_value=work_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.git_handler = GitHandler('test_token', remote_url=self.remote_dir)
 
     def test_message_push_and_verify(self):
         """Test pushing a message and verifying it exists in the repository"""
@@ -36,16 +63,25 @@ class TestGitIntegration(unittest.TestCase):
             self.assertIsNotNone(commit_hash)
             print(f"Message stored with commit hash: {commit_hash}")
 
+            # Verify the commit reached the local remote
+            if self.remote_dir:
+                remote_head = subprocess.run(
+                    ['git', '--git-dir', self.remote_dir, 'rev-parse', 'main'],
+                    check=True, capture_output=True, text=True
+                ).stdout.strip()
+                self.assertEqual(remote_head, commit_hash)
+
             # Verify the message file exists
             messages_dir = os.path.join(self.git_handler.repo_path, 'messages')
             self.assertTrue(os.path.exists(messages_dir))
             
-            # Find and verify the message file
-            message_files = [f for f in os.listdir(messages_dir) if message_id in f]
-            self.assertTrue(len(message_files) > 0)
-            
-            # Get the most recent message file
-            message_file = sorted(message_files)[-1]
+            # Find the most recent message file; names start with a timestamp
+            with os.scandir(messages_dir) as entries:
+                message_file = max(
+                    (entry.name for entry in entries if message_id in entry.name),
+                    default=None
+                )
+            self.assertIsNotNone(message_file)
             
             # Verify file contents
             with open(os.path.join(messages_dir, message_file), 'r') as f:
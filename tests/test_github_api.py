@@ -4,46 +4,81 @@ import unittest
 import os
 import sys
 import requests
+import json
+from urllib.parse import urlsplit, parse_qsl
 from datetime import datetime, timedelta
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 
 # Add src directory to Python path
 sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
 
 from github_api import GitHubAPI, CommitInfo
 
+# Sample commit data for mocking; a tuple since the tests share it
+SAMPLE_COMMITS = (
+    {
+        "sha": "abc123",
+        "commit": {
+            "message": "First commit",
+            "author": {
+                "name": "Test User",
+                "email": "test@example.com",
+                "date": "2025-01-05T20:19:29-05:00"
+            }
+        },
+        "html_url": "https://github.com/owner/repo/commit/abc123"
+    },
+    {
+        "sha": "def456",
+        "commit": {
+            "message": "Second commit",
+            "author": {
+                "name": "Test User",
+                "email": "test@example.com",
+                "date": "2025-01-05T20:18:29-05:00"
+            }
+        },
+        "html_url": "https://github.com/owner/repo/commit/def456"
+    }
+)
+
+class _MockAdapter(requests.adapters.HTTPAdapter):
+    """Transport adapter that answers with queued responses instead of the network"""
+
+    def __init__(self):
+        super().__init__()
+        self.responses = []
+        self.requests = []
+        self.timeouts = []
+
+    def queue(self, status_code, body, headers=None):
+        """Queue a response; the last one queued answers any further requests"""
+        self.responses.append((status_code, json.dumps(body).encode(), headers or {}))
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        self.timeouts.append(kwargs.get("timeout"))
+        status_code, content, headers = (
+            self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+        )
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = content
+        response.headers.update(headers)
+        response.url = request.url
+        response.request = request
+        return response
+
+    @property
+    def last_request(self):
+        return self.requests[-1]
+
 class TestGitHubAPI(unittest.TestCase):
     def setUp(self):
         """Set up test fixtures"""
         self.api = GitHubAPI("test_token")
-        
-        # Sample commit data for mocking
-        self.sample_commits = [
-            {
-                "sha": "abc123",
-                "commit": {
-                    "message": "First commit",
-                    "author": {
-                        "name": "Test User",
-                        "email": "test@example.com",
-                        "date": "2025-01-05T20:19:29-05:00"
-                    }
-                },
-                "html_url": "https://github.com/owner/repo/commit/abc123"
-            },
-            {
-                "sha": "def456",
-                "commit": {
-                    "message": "Second commit",
-                    "author": {
-                        "name": "Test User",
-                        "email": "test@example.com",
-                        "date": "2025-01-05T20:18:29-05:00"
-                    }
-                },
-                "html_url": "https://github.com/owner/repo/commit/def456"
-            }
-        ]
+        self.adapter = _MockAdapter()
+        self.api._session.mount("https://", self.adapter)
 
     @patch.dict(os.environ, {}, clear=True)
     def test_init_without_token(self):
@@ -51,24 +86,29 @@ class TestGitHubAPI(unittest.TestCase):
         with self.assertRaises(ValueError):
             GitHubAPI(None)
 
-    @patch('requests.get')
-    def test_get_commits(self, mock_get):
+    def assertRequest(self, request, url, params):
+        """Check a request's URL, query parameters and headers"""
+        parts = urlsplit(request.url)
+        self.assertEqual(f"{parts.scheme}://{parts.netloc}{parts.path}", url)
+        self.assertEqual(dict(parse_qsl(parts.query)), {k: str(v) for k, v in params.items()})
+        for name, value in self.api.headers.items():
+            self.assertEqual(request.headers[name], value)
+
+    def test_get_commits(self):
         """Test fetching commits"""
-        # Mock response
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = self.sample_commits
-        mock_get.return_value = mock_response
+        self.adapter.queue(200, SAMPLE_COMMITS)
 
         # Test getting commits
         commits = self.api.get_commits("owner", "repo")
 
         # Verify request was made correctly
-        mock_get.assert_called_once_with(
+        self.assertEqual(len(self.adapter.requests), 1)
+        self.assertRequest(
+            self.adapter.last_request,
             "https://api.github.com/repos/owner/repo/commits",
-            headers=self.api.headers,
-            params={'per_page': 30, 'page': 1}
+            {'per_page': 30, 'page': 1}
         )
+        self.assertEqual(self.adapter.timeouts, [10])
 
         # Verify response parsing
         self.assertEqual(len(commits), 2)
@@ -79,14 +119,9 @@ class TestGitHubAPI(unittest.TestCase):
         self.assertEqual(commits[0].author_email, "test@example.com")
         self.assertEqual(commits[0].url, "https://github.com/owner/repo/commit/abc123")
 
-    @patch('requests.get')
-    def test_get_commits_with_filters(self, mock_get):
+    def test_get_commits_with_filters(self):
         """Test fetching commits with filters"""
-        # Mock response
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = self.sample_commits
-        mock_get.return_value = mock_response
+        self.adapter.queue(200, SAMPLE_COMMITS)
 
         # Test parameters
         path = "src/app.py"
@@ -107,10 +142,11 @@ class TestGitHubAPI(unittest.TestCase):
         )
 
         # Verify request was made with correct parameters
-        mock_get.assert_called_once_with(
+        self.assertEqual(len(self.adapter.requests), 1)
+        self.assertRequest(
+            self.adapter.last_request,
             "https://api.github.com/repos/owner/repo/commits",
-            headers=self.api.headers,
-            params={
+            {
                 'path': path,
                 'since': since.isoformat(),
                 'until': until.isoformat(),
@@ -118,21 +154,74 @@ class TestGitHubAPI(unittest.TestCase):
                 'page': page
             }
         )
+        self.assertEqual(self.adapter.timeouts, [10])
+
+    def test_session_retries_gateway_errors(self):
+        """Test that requests share one session that retries gateway errors"""
+        # A fresh client; setUp's has the mock transport mounted
+        api = GitHubAPI("test_token")
+        adapter = api._session.get_adapter("https://api.github.com/repos/owner/repo/commits")
+        self.assertEqual(adapter.max_retries.total, 3)
+        self.assertIn(503, adapter.max_retries.status_forcelist)
+
+    def test_get_commits_not_modified(self):
+        """Test that a 304 response returns the commits cached with its ETag"""
+        # Always revalidate instead of reusing the cached response
+        self.api.cache_ttl = 0
+        self.adapter.queue(200, SAMPLE_COMMITS, {"ETag": '"abc"'})
+        self.adapter.queue(304, None)
+
+        first = self.api.get_commits("owner", "repo")
+        second = self.api.get_commits("owner", "repo")
+
+        self.assertEqual(second, first)
+        self.assertEqual(self.adapter.last_request.headers["If-None-Match"], '"abc"')
+        self.assertEqual(len(self.adapter.requests), 2)
+
+    def test_get_commits_cached(self):
+        """Test that a recent identical request is answered from the cache"""
+        self.adapter.queue(200, SAMPLE_COMMITS)
+
+        first = self.api.get_commits("owner", "repo")
+        second = self.api.get_commits("owner", "repo")
+        self.assertEqual(second, first)
+        self.assertEqual(len(self.adapter.requests), 1)
+
+        self.api.invalidate()
+        self.api.get_commits("owner", "repo")
+        self.assertEqual(len(self.adapter.requests), 2)
+
+    def test_get_commit_messages_pages(self):
+        """Test that pages are combined in order and stop at the last page"""
+        def get_commits(owner, repo, per_page, page):
+            count = per_page if page < 3 else 1
+            return [
+                CommitInfo(f"{page}-{i}", f"Message {page}-{i}", "Test User",
+                           "test@example.com", "2025-01-05T20:19:29-05:00", "")
+                for i in range(count)
+            ]
+
+        # Windows of pages 2-3 and 4-5; the short page 3 ends the first
+        with patch.object(self.api, 'get_commits', side_effect=get_commits) as mock_get_commits, \
+                patch('github_api.MAX_PAGE_WORKERS', 2):
+            messages = self.api.get_commit_messages("owner", "repo", max_commits=500)
+
+        self.assertEqual(len(messages), 201)
+        self.assertEqual(
+            sorted(call.kwargs["page"] for call in mock_get_commits.call_args_list),
+            [1, 2, 3]
+        )
+        self.assertEqual(messages[0], "Message 1-0")
+        self.assertEqual(messages[100], "Message 2-0")
+        self.assertEqual(messages[-1], "Message 3-0")
 
-    @patch('requests.get')
-    def test_get_commits_error(self, mock_get):
+    def test_get_commits_error(self):
         """Test error handling when fetching commits"""
         # Mock error response
-        mock_response = MagicMock()
-        mock_response.status_code = 404
-        mock_response.json.return_value = {"message": "Not Found"}
-        mock_response.raise_for_status.side_effect = requests.exceptions.HTTPError(
-            "404 Client Error: Not Found"
-        )
-        mock_get.return_value = mock_response
+        self.adapter.queue(404, {"message": "Not Found"})
 
-        # Test error handling
-        with self.assertRaises(requests.exceptions.HTTPError):
+        # Test error handling; get_commits reports a 404 as a missing repository
+        with self.assertRaisesRegex(ValueError, "not found"):
             self.api.get_commits("owner", "nonexistent-repo")
 
 if __name__ == "__main__":
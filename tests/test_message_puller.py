@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+import unittest
+import os
+import sys
+import io
+import json
+import shutil
+import tempfile
+import subprocess
+import zipfile
+from unittest.mock import patch, MagicMock
+
+# Add src directory to Python path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
+
+from message_puller import MessagePuller, MAX_MESSAGE_FILE_SIZE
+
+# Commits in the test repositories need an identity, whatever the user's git config
+GIT_ENV = dict(
+    os.environ,
+    GIT_AUTHOR_NAME="Test User",
+    GIT_AUTHOR_EMAIL="test@example.com",
+    GIT_COMMITTER_NAME="Test User",
+    GIT_COMMITTER_EMAIL="test@example.com"
+)
+
+def make_zipball(files):
+    """
+    Build a zip laid out like a GitHub zipball
+    :param files: Dict of path inside the repository -> content
+    :return: Zip archive as bytes
+    """
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as zf:
+        for name, content in files.items():
+            zf.writestr(f"owner-repo-abc123/{name}", content)
+    return buf.getvalue()
+
+def zipball_response(data):
+    """Mock streaming response whose body is the given archive"""
+    response = MagicMock()
+    response.__enter__.return_value = response
+    response.iter_content.return_value = [data[i:i + 1024] for i in range(0, len(data), 1024)]
+    return response
+
+def message_file(content, timestamp):
+    """Content of a message file in the server's format"""
+    return json.dumps({"content": content, "timestamp": timestamp})
+
+class TestMessagePuller(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment"""
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        self.cache_path = os.path.join(self.test_dir, "pull.sqlite")
+        self.puller = MessagePuller(
+            "test_token",
+            cache_path=self.cache_path,
+            repos_dir=os.path.join(self.test_dir, "repos")
+        )
+        self.addCleanup(self.puller.close)
+
+    def test_close_stops_file_threads(self):
+        """Test that closing the puller shuts down its file-reading pool"""
+        with MessagePuller("test_token", cache_path=None, repos_dir=None) as puller:
+            pass
+        with self.assertRaises(RuntimeError):
+            puller._file_executor.submit(print)
+
+    def test_download_repo_extracts_messages(self):
+        """Test that only the messages directory of the zipball is extracted"""
+        data = make_zipball({
+            "README.md": "readme",
+            "messages/1.json": message_file("First", "2024-01-01T00:00:00"),
+            "messages/sub/2.txt": "Second"
+        })
+
+        with patch.object(self.puller.session, 'get', return_value=zipball_response(data)):
+            repo_dir = self.puller.download_repo("owner/repo", self.test_dir)
+
+        self.assertIsNotNone(repo_dir)
+        self.assertFalse(os.path.exists(os.path.join(repo_dir, "README.md")))
+        messages = self.puller.get_messages_from_repo(repo_dir)
+        self.assertEqual(
+            sorted((m['path'], m['content']) for m in messages),
+            [("1.json", "First"), (os.path.join("sub", "2.txt"), "Second")]
+        )
+
+    def test_download_repo_keeps_repositories_apart(self):
+        """Test that repositories whose names only differ in / and _ get separate directories"""
+        repo_dirs = {}
+        for repo in ("a_b/c", "a/b_c"):
+            data = make_zipball({"messages/1.json": message_file(repo, "2024-01-01T00:00:00")})
+            with patch.object(self.puller.session, 'get', return_value=zipball_response(data)):
+                repo_dirs[repo] = self.puller.download_repo(repo, self.test_dir)
+
+        self.assertNotEqual(repo_dirs["a_b/c"], repo_dirs["a/b_c"])
+        for repo, repo_dir in repo_dirs.items():
+            messages = self.puller.get_messages_from_repo(repo_dir)
+            self.assertEqual([m['content'] for m in messages], [repo])
+
+    def test_download_repo_rejects_zip_slip(self):
+        """Test that an entry escaping the repository directory fails the download"""
+        data = make_zipball({
+            "messages/1.json": message_file("First", "2024-01-01T00:00:00"),
+            "messages/../../evil.json": "{}"
+        })
+
+        with patch.object(self.puller.session, 'get', return_value=zipball_response(data)):
+            repo_dir = self.puller.download_repo("owner/repo", self.test_dir)
+
+        self.assertIsNone(repo_dir)
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir, "evil.json")))
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir, "owner", "repo")))
+
+    def test_extract_messages_rejects_zip_slip(self):
+        """Test that an entry resolving outside the repository directory raises ValueError"""
+        data = make_zipball({"messages/../../evil": "evil"})
+        repo_dir = os.path.join(self.test_dir, "repo")
+
+        with self.assertRaises(ValueError):
+            self.puller._extract_messages(io.BytesIO(data), repo_dir)
+
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir, "evil")))
+        self.assertEqual(os.listdir(self.test_dir), ["repo"])
+        self.assertEqual(os.listdir(repo_dir), [])
+
+    def test_extract_messages_skips_oversized_entry(self):
+        """Test that an entry larger than a message file can be is not written to disk"""
+        data = make_zipball({
+            "messages/1.json": message_file("First", "2024-01-01T00:00:00"),
+            "messages/big.txt": "x" * (MAX_MESSAGE_FILE_SIZE + 1)
+        })
+        repo_dir = os.path.join(self.test_dir, "repo")
+
+        self.puller._extract_messages(io.BytesIO(data), repo_dir)
+
+        self.assertEqual(os.listdir(os.path.join(repo_dir, "messages")), ["1.json"])
+
+    def test_pull_cache_hit_and_miss(self):
+        """Test that an unchanged HEAD is served from the cache and a new one is downloaded"""
+        def download_repo(repo, temp_dir):
+            repo_dir = self.puller._repo_dir(temp_dir, repo)
+            os.makedirs(os.path.join(repo_dir, "messages"))
+            with open(os.path.join(repo_dir, "messages", "1.json"), 'w') as f:
+                f.write(message_file("First", "2024-01-01T00:00:00"))
+            return repo_dir
+
+        with patch.object(self.puller, 'get_remote_head_conditional') as mock_head, \
+                patch.object(self.puller, 'download_repo', side_effect=download_repo) as mock_download:
+            # Miss: nothing cached yet
+            mock_head.return_value = ("head1", '"etag1"')
+            first = self.puller.pull_messages(["owner/repo"])
+            self.assertEqual(mock_download.call_count, 1)
+            mock_head.assert_called_with("owner/repo")
+
+            # Hit: HEAD has not moved
+            second = self.puller.pull_messages(["owner/repo"])
+            self.assertEqual(mock_download.call_count, 1)
+            mock_head.assert_called_with("owner/repo", "head1", '"etag1"')
+            self.assertEqual(second, first)
+
+            # Miss: HEAD moved
+            mock_head.return_value = ("head2", '"etag2"')
+            third = self.puller.pull_messages(["owner/repo"])
+            self.assertEqual(mock_download.call_count, 2)
+            self.assertEqual(third, first)
+
+        self.assertEqual([m['content'] for m in first], ["First"])
+
+    def _make_source_repo(self):
+        """Create a local repository with messages and other files to clone from"""
+        source = os.path.join(self.test_dir, "source")
+        os.makedirs(os.path.join(source, "messages"))
+        os.makedirs(os.path.join(source, "src"))
+        with open(os.path.join(source, "src", "app.py"), 'w') as f:
+            f.write("print('app')")
+        with open(os.path.join(source, "messages", "1.json"), 'w') as f:
+            f.write(message_file("First", "2024-01-01T00:00:00"))
+        self._git(source, "init", "-b", "main")
+        self._git(source, "add", ".")
+        self._git(source, "commit", "-m", "Initial commit")
+        return source
+
+    def _git(self, cwd, *args):
+        """Run a git command in the given directory"""
+        subprocess.run(["git"] + list(args), cwd=cwd, env=GIT_ENV, check=True, capture_output=True)
+
+    def test_sparse_clone_fallback(self):
+        """Test that a failed download falls back to a sparse clone, then updates it"""
+        source = self._make_source_repo()
+        self.puller.cache_path = None
+        self.puller._remote_url = lambda repo: "file://" + source
+
+        with patch.object(self.puller, 'download_repo', return_value=None):
+            messages = self.puller.pull_messages(["owner/repo"])
+            self.assertEqual([m['content'] for m in messages], ["First"])
+
+            # Other directories are not checked out
+            clone = os.path.join(self.test_dir, "repos", "owner", "repo")
+            self.assertTrue(os.path.exists(os.path.join(clone, "messages", "1.json")))
+            self.assertFalse(os.path.exists(os.path.join(clone, "src")))
+
+            # The kept clone is updated with the new commit on the next pull
+            with open(os.path.join(source, "messages", "2.json"), 'w') as f:
+                f.write(message_file("Second", "2024-01-02T00:00:00"))
+            self._git(source, "add", ".")
+            self._git(source, "commit", "-m", "Add message")
+            messages = self.puller.pull_messages(["owner/repo"])
+
+        self.assertEqual([m['content'] for m in messages], ["Second", "First"])
+
+if __name__ == '__main__':
+    unittest.main()